@@ -0,0 +1,171 @@
+import argparse
+import sys
+
+# Command-line entry point for the experiments.
+# Only argparse is imported here; every subcommand imports its module
+# (and through it pandas, matplotlib, dimod, qubovert, scipy) when it runs.
+#
+# Examples:
+#     python cli.py run qubo_matrices -p 200:100:200:10:0.0:0.2 -p 200:100:200:10:0.1:0.2
+#     python cli.py rework mbo
+#     python cli.py plot test_results\qubo_matrices\task_1
+#     python cli.py plot --all qubo_matrices
+#     python cli.py queue init queue.db qubo_matrices -p 1000:100:1000:100:0.0:0.1
+#     python cli.py queue work queue.db -j 8       (on every node)
+#     python cli.py queue export queue.db --plot
+
+# Parses string in format {total_num_anneals}:{start}:{stop}:{step}:{fixing_threshold}:{elite_threshold}
+# into tuple (total_num_anneals, range(start, stop, step), fixing_threshold, elite_threshold)
+def parse_params(value : str) -> tuple[int, range, float, float]:
+    parts = value.split(":")
+    if len(parts) != 6:
+        raise argparse.ArgumentTypeError(
+            f"expected TOTAL:START:STOP:STEP:FIXING:ELITE, got '{value}'")
+    try:
+        total_num_anneals, start, stop, step = map(int, parts[:4])
+        fixing_threshold, elite_threshold = map(float, parts[4:])
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"bad number in params '{value}'")
+    return tuple([total_num_anneals, range(start, stop, step), fixing_threshold, elite_threshold])
+
+def positive_int(value : str) -> int:
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected integer, got '{value}'")
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"expected positive integer, got '{value}'")
+    return number
+
+def positive_float(value : str) -> float:
+    try:
+        number = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected number, got '{value}'")
+    if not number > 0:
+        raise argparse.ArgumentTypeError(f"expected positive number, got '{value}'")
+    return number
+
+def run(args : argparse.Namespace):
+    import test_spvar
+
+    params = args.params if args.params else test_spvar.DEFAULT_PARAMS
+    test_spvar.test_multiple_params_over_directory(params, args.data_dir)
+
+def rework(args : argparse.Namespace):
+    import rework_results
+
+    rework_results.rework_result_directory(args.dir, not args.plots_only)
+
+def plot(args : argparse.Namespace):
+    if args.all:
+        import rework_results
+        rework_results.draw_plots_for_all_tasks(args.path)
+    else:
+        import test_spvar
+        test_spvar.draw_plot(args.path)
+
+def queue_init(args : argparse.Namespace):
+    import test_spvar
+    import work_queue
+
+    params = args.params if args.params else test_spvar.DEFAULT_PARAMS
+    added = work_queue.enqueue_directory(args.db, params, args.data_dir)
+    print(f"Added {added} tasks")
+
+def queue_work(args : argparse.Namespace):
+    import work_queue
+
+    if args.jobs == 1:
+        work_queue.work(args.db, args.worker, args.lease, args.poll, args.max_attempts, args.task_timeout)
+        return
+    try:
+        work_queue.work_parallel(args.db, args.jobs, args.lease, args.poll, args.max_attempts, args.task_timeout)
+    except RuntimeError as e:
+        sys.exit(str(e))
+
+def queue_status(args : argparse.Namespace):
+    import work_queue
+
+    for status, count in sorted(work_queue.queue_status(args.db).items()):
+        print(f"{status}: {count}")
+
+def queue_export(args : argparse.Namespace):
+    import work_queue
+
+    work_queue.export_results(args.db, args.plot)
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="SPVAR experiments")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="run parameter sweeps over a data directory")
+    run_parser.add_argument("data_dir", help="directory with QUBO .csv files, relative to test_data")
+    run_parser.add_argument(
+        "-p", "--params", action="append", type=parse_params,
+        metavar="TOTAL:START:STOP:STEP:FIXING:ELITE",
+        help="sweep params, may be repeated (default: test_spvar.DEFAULT_PARAMS)")
+    run_parser.set_defaults(func=run)
+
+    rework_parser = subparsers.add_parser("rework", help="convert old results to the new format")
+    rework_parser.add_argument("dir", help="directory with old results, relative to old_test_results")
+    rework_parser.add_argument(
+        "--plots-only", action="store_true",
+        help="do not rebuild .csv files, only redraw plots")
+    rework_parser.set_defaults(func=rework)
+
+    plot_parser = subparsers.add_parser("plot", help="draw plots by .csv results")
+    plot_parser.add_argument(
+        "path",
+        help="directory with .csv results, or (with --all) tasks directory relative to test_results")
+    plot_parser.add_argument(
+        "--all", action="store_true",
+        help="draw plots for every task in the tasks directory")
+    plot_parser.set_defaults(func=plot)
+
+    queue_parser = subparsers.add_parser("queue", help="run sweeps on many nodes through a shared SQLite queue")
+    queue_subparsers = queue_parser.add_subparsers(dest="queue_command", required=True)
+
+    init_parser = queue_subparsers.add_parser("init", help="add sweep tasks to the queue")
+    init_parser.add_argument("db", help="queue file on a filesystem shared by all nodes")
+    init_parser.add_argument("data_dir", help="directory with QUBO .csv files, relative to test_data")
+    init_parser.add_argument(
+        "-p", "--params", action="append", type=parse_params,
+        metavar="TOTAL:START:STOP:STEP:FIXING:ELITE",
+        help="sweep params, may be repeated (default: test_spvar.DEFAULT_PARAMS)")
+    init_parser.set_defaults(func=queue_init)
+
+    work_parser = queue_subparsers.add_parser("work", help="claim and run tasks until the queue is drained")
+    work_parser.add_argument("db", help="queue file")
+    work_parser.add_argument("-j", "--jobs", type=positive_int, default=1, help="number of worker processes on this node")
+    work_parser.add_argument("--worker", default=None, help="worker id (default: host:pid), only with -j 1")
+    work_parser.add_argument(
+        "--lease", type=positive_float, default=600,
+        help="lease duration in seconds; a task is reclaimed if its worker misses heartbeats this long")
+    work_parser.add_argument(
+        "--task-timeout", type=positive_float, default=24 * 60 * 60,
+        help="seconds a claimed task may run; after that it is reclaimed even if its worker is alive")
+    work_parser.add_argument("--poll", type=positive_float, default=30, help="seconds between claims when nothing is free")
+    work_parser.add_argument("--max-attempts", type=positive_int, default=3, help="attempts before a failing task is given up")
+    work_parser.set_defaults(func=queue_work)
+
+    status_parser = queue_subparsers.add_parser("status", help="print count of tasks by status")
+    status_parser.add_argument("db", help="queue file")
+    status_parser.set_defaults(func=queue_status)
+
+    export_parser = queue_subparsers.add_parser("export", help="write results of done tasks to .csv files")
+    export_parser.add_argument("db", help="queue file")
+    export_parser.add_argument("--plot", action="store_true", help="also draw plots for updated directories")
+    export_parser.set_defaults(func=queue_export)
+
+    return parser
+
+def main(argv : list[str] | None = None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == "queue" and args.queue_command == "work" and args.worker is not None and args.jobs != 1:
+        parser.error("--worker can be used only with -j 1")
+    args.func(args)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,6 +1,4 @@
 import test_spvar
-import pandas as pd
-from functools import *
 import os
 
 DIR_OLD_RESULTS = "old_test_results"
@@ -17,7 +15,8 @@ def draw_plots_for_all_tasks(tasks_dir : str):
 # e.g fills files in {DIR_RESULTS}\\mbo  by data in {DIR_OLD_RESULTS}\\mbo,
 # files in {DIR_RESULTS}\\knapsack  by data in {DIR_OLD_RESULTS}\\knapcack and so on
 def rework_result_directory(dir : str, need_build_csv : bool = True):
-    
+    import pandas as pd
+
     old_dir_path = f"{DIR_OLD_RESULTS}\\{dir}"
     dirs = sorted(os.listdir(old_dir_path))
     
@@ -1,20 +1,32 @@
-from dataclasses import dataclass
-import spvar
-import read_matrices
-import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-from functools import *
 import os
-from math import *
+
+# pandas, numpy, matplotlib and the annealing stack (spvar, read_matrices -> dimod,
+# qubovert, scipy) are imported inside the functions that use them,
+# so importing this module (e.g. from cli.py or a worker process) stays cheap
+
+# experiment script, not a test module: keep pytest from collecting test_* functions below
+__test__ = False
 
 DIR_OLD_RESULTS = "old_test_results"
 DIR_RESULTS = "test_results"
 DIR_DATA = "test_data"
 
+# sample sweep params [total_num_anneals, SPVAR_num_anneals_range, fixing_threshold, elite_threshold],
+# used by main() and as default params of cli.py
+DEFAULT_PARAMS = [
+    tuple([200, range(100, 200, 10), 0.0, 0.2]),
+    tuple([200, range(100, 200, 10), 0.1, 0.2]),
+]
+
 # draws diagram by results (.csv files) in directory dir_results
 # plot will be places in dir_results
 def draw_plot(dir_results : str):
+    import pandas as pd
+    import numpy as np
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
     files = []
 
     for file in os.listdir(dir_results):
@@ -102,7 +114,10 @@ def test_different_num_anneals(
         data_file_path : str,
         ignore_calced : bool = False,
         draw_bars : bool = True):
-    
+    import pandas as pd
+    import spvar
+    import read_matrices
+
     [h, J, _] = read_matrices.read_qubo_from_file(data_file_path)
     num_vars = len(h.keys())
     
@@ -190,15 +205,12 @@ def test_multiple_params_over_directory(
             pass
         
         test_multiple_params(params, results_file_dir, data_file_path)
+
 def main():
 
     # sample of using:
 
-    params = [
-        tuple([200, range(100, 200, 10), 0.0, 0.2]),
-        tuple([200, range(100, 200, 10), 0.1, 0.2]),
-    ]
-
-    test_multiple_params_over_directory(params, "qubo_matrices")
+    test_multiple_params_over_directory(DEFAULT_PARAMS, "qubo_matrices")
 
-main()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+import os
+import threading
+import pytest
+import work_queue
+
+LEASE = 10
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(work_queue.time, "time", clock.time)
+    monkeypatch.setattr(work_queue.time, "sleep", lambda seconds: None)
+    return clock
+
+# Queue with tasks for two data files and params [200, range(100, 200, 50), 0.0, 0.2]
+@pytest.fixture
+def db(tmp_path, monkeypatch) -> str:
+    data_dir = tmp_path / work_queue.DIR_DATA / "d"
+    data_dir.mkdir(parents=True)
+    (data_dir / "a.csv").write_text("1,2\n3,4\n")
+    (data_dir / "b.csv").write_text("1\n")
+    (data_dir / "notes.txt").write_text("")
+    monkeypatch.chdir(tmp_path)
+
+    db_path = str(tmp_path / "queue.db")
+    assert work_queue.enqueue_directory(db_path, [tuple([200, range(100, 200, 50), 0.0, 0.2])], "d") == 4
+    return db_path
+
+def task_row(db_path : str, task_id : int) -> tuple:
+    connection = work_queue.connect(db_path)
+    try:
+        return connection.execute(
+            "SELECT status, worker, attempts, without_SPVAR FROM tasks WHERE id = ?", (task_id,)).fetchone()
+    finally:
+        connection.close()
+
+# Completes tasks 2-4, so only task 1 can be claimed
+def leave_one_task(connection):
+    for task_id in range(2, 5):
+        work_queue.complete_task(connection, task_id, "w", (1.0, 1.0, 0.0))
+
+def test_enqueue_is_idempotent_and_keeps_exact_thresholds(db):
+    params = [tuple([200, range(100, 200, 50), 0.0, 0.2]), tuple([200, range(100, 101), 0.15, 0.25])]
+    assert work_queue.enqueue_directory(db, params, "d") == 2
+
+    connection = work_queue.connect(db)
+    thresholds = connection.execute(
+        "SELECT DISTINCT fixing_threshold, elite_threshold FROM tasks ORDER BY fixing_threshold").fetchall()
+    connection.close()
+    assert thresholds == [(0.0, 0.2), (0.15, 0.25)]
+
+def test_claim_takes_each_task_once(db, clock):
+    connection = work_queue.connect(db)
+    claimed = [work_queue.claim_task(connection, f"w{i}", LEASE) for i in range(5)]
+
+    assert sorted(task.id for task in claimed[:4]) == [1, 2, 3, 4]
+    assert claimed[4] is None
+    assert os.path.join("test_results", "d", "a") == claimed[0].dir_results
+
+def test_expired_lease_is_reclaimed(db, clock):
+    connection = work_queue.connect(db)
+    for i in range(4):
+        work_queue.claim_task(connection, "dead", LEASE)
+
+    clock.now += LEASE / 2
+    assert work_queue.claim_task(connection, "alive", LEASE) is None
+
+    clock.now += LEASE
+    task = work_queue.claim_task(connection, "alive", LEASE)
+    assert task.attempts == 2
+    assert task_row(db, task.id)[:2] == ("leased", "alive")
+
+def test_renew_lease_keeps_task_and_fails_after_reclaim(db, clock):
+    connection = work_queue.connect(db)
+    leave_one_task(connection)
+    task = work_queue.claim_task(connection, "w1", LEASE)
+
+    clock.now += LEASE * 2 / 3
+    assert work_queue.renew_lease(connection, task.id, "w1", LEASE)
+    clock.now += LEASE * 2 / 3
+    assert work_queue.claim_task(connection, "w2", LEASE) is None
+
+    clock.now += LEASE * 2
+    assert work_queue.claim_task(connection, "w2", LEASE).id == task.id
+    assert not work_queue.renew_lease(connection, task.id, "w1", LEASE)
+
+def test_late_complete_is_stored_once(db, clock):
+    connection = work_queue.connect(db)
+    leave_one_task(connection)
+    task = work_queue.claim_task(connection, "w1", LEASE)
+    clock.now += LEASE * 2
+    assert work_queue.claim_task(connection, "w2", LEASE).id == task.id
+
+    work_queue.complete_task(connection, task.id, "w1", (1.0, 2.0, 50.0))
+    work_queue.complete_task(connection, task.id, "w2", (3.0, 4.0, 60.0))
+    assert task_row(db, task.id) == ("done", "w1", 2, 1.0)
+    assert not work_queue.renew_lease(connection, task.id, "w2", LEASE)
+
+def test_fail_task_retries_until_max_attempts(db, clock):
+    connection = work_queue.connect(db)
+    leave_one_task(connection)
+    task = work_queue.claim_task(connection, "w1", LEASE, max_attempts=2)
+    work_queue.fail_task(connection, task.id, "w1", "boom", 2)
+    assert task_row(db, task.id)[0] == "pending"
+
+    task = work_queue.claim_task(connection, "w1", LEASE, max_attempts=2)
+    assert task.attempts == 2
+    work_queue.fail_task(connection, task.id, "w1", "boom", 2)
+    assert task_row(db, task.id)[0] == "failed"
+
+def test_poison_task_fails_after_max_attempts(db, clock):
+    connection = work_queue.connect(db)
+    leave_one_task(connection)
+
+    # every worker that claims task 1 dies without heartbeats
+    for attempt in range(1, 4):
+        task = work_queue.claim_task(connection, f"w{attempt}", LEASE, max_attempts=3)
+        assert (task.id, task.attempts) == (1, attempt)
+        clock.now += LEASE * 2
+
+    assert work_queue.claim_task(connection, "w4", LEASE, max_attempts=3) is None
+    assert task_row(db, 1)[:3] == ("failed", "w3", 3)
+    assert work_queue.work(db, "w5", LEASE, max_attempts=3) == 0
+
+def test_work_runs_all_tasks(db, clock, monkeypatch):
+    calls = []
+
+    def run_task(task, qubo_cache):
+        calls.append(task.id)
+        if task.id == 2 and task.attempts == 1:
+            raise RuntimeError("boom")
+        return (1.0, 2.0, 50.0)
+
+    monkeypatch.setattr(work_queue, "run_task", run_task)
+    assert work_queue.work(db, "w1", LEASE) == 4
+    assert sorted(calls) == [1, 2, 2, 3, 4]
+    assert work_queue.queue_status(db) == {"done": 4}
+
+def test_retry_db_retries_busy_database(clock):
+    calls = []
+
+    def write():
+        calls.append(1)
+        if len(calls) < 3:
+            raise work_queue.sqlite3.OperationalError("database is locked")
+        return "ok"
+
+    assert work_queue.retry_db(write) == "ok"
+    assert len(calls) == 3
+
+    calls.clear()
+    with pytest.raises(work_queue.sqlite3.OperationalError):
+        work_queue.retry_db(write, retries=2)
+    assert len(calls) == 2
+
+def test_heartbeat_survives_unavailable_database(tmp_path, capsys):
+    db_path = str(tmp_path / "missing" / "queue.db")
+    heartbeat = work_queue.Heartbeat(db_path, 1, "w1", 0.03)
+    with heartbeat:
+        work_queue.time.sleep(0.1)
+        assert heartbeat._thread.is_alive()
+    assert not heartbeat.lost
+    assert "heartbeat of task 1 failed" in capsys.readouterr().out
+
+def test_export_keeps_existing_rows(db, clock):
+    pd = pytest.importorskip("pandas")
+    connection = work_queue.connect(db)
+    work_queue.complete_task(connection, 2, "w", (1.0, 2.0, 50.0))
+
+    result_path = os.path.join("test_results", "d", "a", "200_0.0_0.2.csv")
+    os.makedirs(os.path.dirname(result_path))
+    pd.DataFrame(
+        [[100, 5.0, 6.0, 10.0], [150, 7.0, 8.0, 20.0]],
+        columns=["SPVAR num anneals", "Result without SPVAR", "Result with SPVAR", "% fixed vars"]
+    ).to_csv(result_path)
+
+    work_queue.export_results(db, draw_bars=False)
+    df = pd.read_csv(result_path, header=0, index_col=0)
+    assert df["SPVAR num anneals"].to_list() == [100, 150]
+    assert df["Result without SPVAR"].to_list() == [5.0, 1.0]
+    assert not os.path.exists(os.path.join("test_results", "d", "b"))
+
+@pytest.mark.parametrize("max_attempts, expected_status", [(2, "leased"), (1, "failed")])
+def test_hung_task_is_reclaimed_after_deadline(db, clock, max_attempts, expected_status):
+    connection = work_queue.connect(db)
+    leave_one_task(connection)
+    lease = 0.03
+    task = work_queue.claim_task(connection, "w1", lease, max_attempts, task_timeout=25)
+
+    # the worker is alive and heartbeats, but its task never finishes
+    with work_queue.Heartbeat(db, task.id, "w1", lease) as heartbeat:
+        clock.now += 10
+        threading.Event().wait(0.1)
+        assert work_queue.claim_task(connection, "w2", lease, max_attempts) is None
+
+        clock.now += 20
+        threading.Event().wait(0.1)
+        assert heartbeat.lost
+        reclaimed = work_queue.claim_task(connection, "w2", LEASE, max_attempts)
+
+    if expected_status == "leased":
+        assert (reclaimed.id, reclaimed.attempts) == (task.id, 2)
+    else:
+        assert reclaimed is None
+    assert task_row(db, task.id)[0] == expected_status
+
+def test_work_parallel_reports_failed_workers(tmp_path):
+    db_path = str(tmp_path / "missing" / "queue.db")
+    with pytest.raises(RuntimeError, match="2 of 2 worker processes failed"):
+        work_queue.work_parallel(db_path, 2)
+
+def test_export_skips_plot_with_short_files(db, clock, capsys):
+    pd = pytest.importorskip("pandas")
+    connection = work_queue.connect(db)
+    work_queue.complete_task(connection, 1, "w", (1.0, 2.0, 50.0))
+    work_queue.complete_task(connection, 2, "w", (1.0, 2.0, 50.0))
+
+    dir_results = os.path.join("test_results", "d", "a")
+    os.makedirs(dir_results)
+    pd.DataFrame(
+        [[100, 5.0, 6.0, 10.0]],
+        columns=["SPVAR num anneals", "Result without SPVAR", "Result with SPVAR", "% fixed vars"]
+    ).to_csv(os.path.join(dir_results, "200_0.1_0.2.csv"))
+
+    work_queue.export_results(db, draw_bars=True)
+    assert "Skip plot for " in capsys.readouterr().out
+    assert not os.path.exists(os.path.join(dir_results, "results.pdf"))
@@ -0,0 +1,448 @@
+from dataclasses import dataclass
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+# Work queue for running the (data file, params, SPVAR_num_anneals) grid on many nodes.
+#
+# The queue is a SQLite file on a filesystem shared by all nodes. Every task is one
+# honest test (one row of a results .csv). Workers claim tasks with a time-limited lease
+# and renew it by heartbeats while the task runs; if a worker crashes or its node hangs,
+# the lease expires and any other worker reclaims the task. Every claim also has a deadline
+# (task_timeout): after it heartbeats are not accepted, so a task that hangs inside a live
+# worker is reclaimed too. Each claim, whatever way it ended, counts toward max_attempts. Results are stored in the
+# queue itself, a completed task is never overwritten, so late results of reclaimed
+# tasks are harmless. export_results writes the usual
+# {total_num_anneals}_{fixing_threshold}_{elite_threshold}.csv files from the queue.
+#
+# Leases are compared with time.time() of the nodes, so node clocks should be synced
+# (NTP) with an error much less than lease_duration.
+# SQLite is used in rollback journal mode: WAL does not work over network filesystems.
+#
+# Like test_spvar, this module does not import pandas/spvar at import time.
+
+DIR_RESULTS = "test_results"
+DIR_DATA = "test_data"
+
+STATUS_PENDING = "pending"
+STATUS_LEASED = "leased"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+DEFAULT_LEASE_DURATION = 600
+DEFAULT_POLL_INTERVAL = 30
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_TASK_TIMEOUT = 24 * 60 * 60
+DEFAULT_DB_RETRIES = 10
+
+# condition for a leased task whose worker is considered dead or stuck,
+# takes current time twice as parameters
+EXPIRED = "(lease_expires < ? OR deadline < ?)"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    data_file_path TEXT NOT NULL,
+    dir_results TEXT NOT NULL,
+    total_num_anneals INTEGER NOT NULL,
+    SPVAR_num_anneals INTEGER NOT NULL,
+    fixing_threshold REAL NOT NULL,
+    elite_threshold REAL NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_expires REAL,
+    deadline REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    without_SPVAR REAL,
+    with_SPVAR REAL,
+    p_fixed REAL,
+    UNIQUE (data_file_path, total_num_anneals, SPVAR_num_anneals, fixing_threshold, elite_threshold)
+);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, lease_expires);
+"""
+
+@dataclass
+class Task:
+    id : int
+    data_file_path : str
+    dir_results : str
+    total_num_anneals : int
+    SPVAR_num_anneals : int
+    fixing_threshold : float
+    elite_threshold : float
+    attempts : int
+
+def connect(db_path : str) -> sqlite3.Connection:
+    # isolation_level=None: transactions are opened explicitly with BEGIN IMMEDIATE,
+    # so a claim takes the write lock before it reads the candidate task
+    connection = sqlite3.connect(db_path, timeout=60, isolation_level=None)
+    connection.executescript(SCHEMA)
+    return connection
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+# Adds to the queue one task per (data file, params, SPVAR_num_anneals) for all .csv files
+# from DIR_DATA\data_dir, like test_multiple_params_over_directory does.
+# Already existing tasks are kept as is, so it is safe to call it again with an extended grid.
+# Thresholds are stored exactly as given, they are rounded only in names of exported .csv files.
+# Returns count of added tasks
+def enqueue_directory(
+        db_path : str,
+        params : list[tuple[int, range, float, float]],
+        data_dir : str) -> int:
+    data_path = os.path.join(DIR_DATA, data_dir)
+    results_path = os.path.join(DIR_RESULTS, data_dir)
+
+    rows = []
+    for data_file in sorted(os.listdir(data_path)):
+        file_name, file_extention = os.path.splitext(data_file)
+        if (file_extention != ".csv"):
+            continue
+        data_file_path = os.path.join(data_path, data_file)
+        dir_results = os.path.join(results_path, file_name)
+        for (total_num_anneals, SPVAR_num_anneals_range, fixing_threshold, elite_threshold) in params:
+            for SPVAR_num_anneals in SPVAR_num_anneals_range:
+                rows.append(tuple([
+                    data_file_path,
+                    dir_results,
+                    total_num_anneals,
+                    SPVAR_num_anneals,
+                    fixing_threshold,
+                    elite_threshold
+                ]))
+
+    connection = connect(db_path)
+    try:
+        connection.execute("BEGIN IMMEDIATE")
+        before = connection.total_changes
+        connection.executemany(
+            "INSERT OR IGNORE INTO tasks (data_file_path, dir_results, total_num_anneals, "
+            "SPVAR_num_anneals, fixing_threshold, elite_threshold) VALUES (?, ?, ?, ?, ?, ?)",
+            rows)
+        added = connection.total_changes - before
+        connection.execute("COMMIT")
+    finally:
+        connection.close()
+    return added
+
+# Claims one pending task or a task with expired lease or deadline.
+# Such tasks that already used max_attempts attempts are marked as failed instead:
+# their workers were probably killed or hung by the task itself (OOM, crash of annealer, deadlock)
+# The claimed task must be finished in task_timeout seconds (None - no deadline)
+# Returns None if there is nothing to claim right now
+def claim_task(
+        connection : sqlite3.Connection,
+        worker : str,
+        lease_duration : float,
+        max_attempts : int = DEFAULT_MAX_ATTEMPTS,
+        task_timeout : float | None = DEFAULT_TASK_TIMEOUT) -> Task | None:
+    now = time.time()
+    deadline = None if task_timeout is None else now + task_timeout
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        connection.execute(
+            "UPDATE tasks SET status = ?, lease_expires = NULL, deadline = NULL, "
+            "error = 'lease of worker ' || worker || ' expired on attempt ' || attempts "
+            f"WHERE status = ? AND {EXPIRED} AND attempts >= ?",
+            (STATUS_FAILED, STATUS_LEASED, now, now, max_attempts))
+        row = connection.execute(
+            "SELECT id, data_file_path, dir_results, total_num_anneals, SPVAR_num_anneals, "
+            "fixing_threshold, elite_threshold, attempts FROM tasks "
+            f"WHERE status = ? OR (status = ? AND {EXPIRED}) "
+            "ORDER BY attempts, id LIMIT 1",
+            (STATUS_PENDING, STATUS_LEASED, now, now)).fetchone()
+        if row is None:
+            connection.execute("COMMIT")
+            return None
+        connection.execute(
+            "UPDATE tasks SET status = ?, worker = ?, lease_expires = ?, deadline = ?, "
+            "attempts = attempts + 1 WHERE id = ?",
+            (STATUS_LEASED, worker, now + lease_duration, deadline, row[0]))
+        connection.execute("COMMIT")
+    except BaseException:
+        connection.execute("ROLLBACK")
+        raise
+    task = Task(*row)
+    task.attempts += 1
+    return task
+
+# Extends the lease of the task held by worker, but not after the deadline of the task.
+# Returns False if the lease was lost (task was reclaimed by another worker, already done
+# or its deadline has passed)
+def renew_lease(connection : sqlite3.Connection, task_id : int, worker : str, lease_duration : float) -> bool:
+    now = time.time()
+    cursor = connection.execute(
+        "UPDATE tasks SET lease_expires = ? "
+        "WHERE id = ? AND worker = ? AND status = ? AND (deadline IS NULL OR deadline >= ?)",
+        (now + lease_duration, task_id, worker, STATUS_LEASED, now))
+    return cursor.rowcount == 1
+
+# Saves result of the task. It is accepted from any worker, even from one whose lease
+# has expired, but only the first result is stored: completing done task does nothing
+def complete_task(
+        connection : sqlite3.Connection,
+        task_id : int,
+        worker : str,
+        result : tuple[float, float, float]):
+    (without_SPVAR, with_SPVAR, p_fixed) = result
+    connection.execute(
+        "UPDATE tasks SET status = ?, worker = ?, lease_expires = NULL, deadline = NULL, error = NULL, "
+        "without_SPVAR = ?, with_SPVAR = ?, p_fixed = ? WHERE id = ? AND status != ?",
+        (STATUS_DONE, worker, without_SPVAR, with_SPVAR, p_fixed, task_id, STATUS_DONE))
+
+# Returns the task to the queue after an exception in worker,
+# or marks it as failed after max_attempts attempts
+def fail_task(
+        connection : sqlite3.Connection,
+        task_id : int,
+        worker : str,
+        error : str,
+        max_attempts : int):
+    connection.execute(
+        "UPDATE tasks SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, "
+        "lease_expires = NULL, deadline = NULL, error = ? WHERE id = ? AND worker = ? AND status = ?",
+        (max_attempts, STATUS_FAILED, STATUS_PENDING, error, task_id, worker, STATUS_LEASED))
+
+# Calls function(*args), retrying it if the shared filesystem is busy or briefly unavailable.
+# Delay between attempts doubles from 1 to 60 seconds; after retries attempts the error is raised
+def retry_db(function, *args, retries : int = DEFAULT_DB_RETRIES):
+    delay = 1
+    for attempt in range(retries):
+        try:
+            return function(*args)
+        except sqlite3.OperationalError as e:
+            if attempt == retries - 1:
+                raise
+            print(f"{function.__name__} failed: {e!r}, retrying in {delay} s")
+            time.sleep(delay)
+            delay = min(delay * 2, 60)
+
+# Returns count of pending and leased tasks
+def count_unfinished(connection : sqlite3.Connection) -> int:
+    (unfinished,) = connection.execute(
+        "SELECT COUNT(*) FROM tasks WHERE status IN (?, ?)",
+        (STATUS_PENDING, STATUS_LEASED)).fetchone()
+    return unfinished
+
+# Returns dict {status: count of tasks}
+def queue_status(db_path : str) -> dict[str, int]:
+    connection = connect(db_path)
+    try:
+        rows = connection.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status").fetchall()
+    finally:
+        connection.close()
+    return dict(rows)
+
+# Renews the lease every lease_duration / 3 seconds in a background thread
+# while the task is running. Uses its own connection: sqlite3 connections
+# must not be shared between threads
+class Heartbeat:
+
+    def __init__(self, db_path : str, task_id : int, worker : str, lease_duration : float):
+        self.db_path = db_path
+        self.task_id = task_id
+        self.worker = worker
+        self.lease_duration = lease_duration
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        connection = None
+        try:
+            while not self._stop.wait(self.lease_duration / 3):
+                try:
+                    if connection is None:
+                        connection = connect(self.db_path)
+                    if not renew_lease(connection, self.task_id, self.worker, self.lease_duration):
+                        print(f"{self.worker}: lease of task {self.task_id} was lost or its deadline has passed")
+                        self.lost = True
+                        return
+                except sqlite3.OperationalError as e:
+                    # shared filesystem is busy or briefly unavailable, try on the next beat
+                    print(f"{self.worker}: heartbeat of task {self.task_id} failed: {e!r}")
+        finally:
+            if connection is not None:
+                connection.close()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+# Runs one honest test for the task.
+# qubo_cache keeps [h, J] of already read data files, tasks of one file usually go in a row
+# Returns tuple (result without spvar, result with spvar, % fixed vars)
+def run_task(task : Task, qubo_cache : dict) -> tuple[float, float, float]:
+    import spvar
+    import read_matrices
+
+    if task.data_file_path not in qubo_cache:
+        qubo_cache.clear()
+        [h, J, _] = read_matrices.read_qubo_from_file(task.data_file_path)
+        qubo_cache[task.data_file_path] = tuple([h, J])
+    [h, J] = qubo_cache[task.data_file_path]
+    num_vars = len(h.keys())
+
+    param = spvar.SPVAR_test_honest_params(
+        h,
+        J,
+        task.total_num_anneals,
+        task.SPVAR_num_anneals,
+        task.fixing_threshold,
+        task.elite_threshold
+    )
+    s = spvar.SPVAR()
+    [without_SPVAR, with_SPVAR, cnt_fixed] = s.test_honest(param)
+    return tuple([float(without_SPVAR), float(with_SPVAR), round(cnt_fixed / num_vars * 100, 1)])
+
+# Claims and runs tasks until the queue has no pending and no leased tasks.
+# While other workers hold leases, polls every poll_interval seconds:
+# their tasks are reclaimed here if they stop heartbeating or miss their deadline.
+# Returns count of tasks completed by this worker
+def work(
+        db_path : str,
+        worker : str | None = None,
+        lease_duration : float = DEFAULT_LEASE_DURATION,
+        poll_interval : float = DEFAULT_POLL_INTERVAL,
+        max_attempts : int = DEFAULT_MAX_ATTEMPTS,
+        task_timeout : float | None = DEFAULT_TASK_TIMEOUT) -> int:
+    if worker is None:
+        worker = default_worker_id()
+
+    connection = connect(db_path)
+    qubo_cache = dict()
+    completed = 0
+    try:
+        while True:
+            task = retry_db(claim_task, connection, worker, lease_duration, max_attempts, task_timeout)
+            if task is None:
+                if retry_db(count_unfinished, connection) == 0:
+                    return completed
+                time.sleep(poll_interval)
+                continue
+
+            print(f"{worker}: start task {task}")
+            try:
+                with Heartbeat(db_path, task.id, worker, lease_duration) as heartbeat:
+                    result = run_task(task, qubo_cache)
+            except Exception as e:
+                print(f"{worker}: task {task.id} failed: {e!r}")
+                retry_db(fail_task, connection, task.id, worker, repr(e), max_attempts)
+                continue
+
+            if heartbeat.lost:
+                print(f"{worker}: lease of task {task.id} was lost, saving result anyway")
+            retry_db(complete_task, connection, task.id, worker, result)
+            completed += 1
+    finally:
+        connection.close()
+
+def _work_process(
+        db_path : str,
+        worker : str,
+        lease_duration : float,
+        poll_interval : float,
+        max_attempts : int,
+        task_timeout : float | None):
+    work(db_path, worker, lease_duration, poll_interval, max_attempts, task_timeout)
+
+# Runs num_workers worker processes on this node and waits for them.
+# Raises RuntimeError if any of them exited with an error
+def work_parallel(
+        db_path : str,
+        num_workers : int,
+        lease_duration : float = DEFAULT_LEASE_DURATION,
+        poll_interval : float = DEFAULT_POLL_INTERVAL,
+        max_attempts : int = DEFAULT_MAX_ATTEMPTS,
+        task_timeout : float | None = DEFAULT_TASK_TIMEOUT):
+    import multiprocessing
+
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(
+            target=_work_process,
+            args=(db_path, f"{default_worker_id()}:{i}", lease_duration, poll_interval, max_attempts, task_timeout))
+        for i in range(num_workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    exit_codes = [process.exitcode for process in processes]
+    failed = [code for code in exit_codes if code != 0]
+    if failed:
+        raise RuntimeError(f"{len(failed)} of {num_workers} worker processes failed, exit codes: {exit_codes}")
+
+# Writes results of done tasks to {dir_results}\{total_num_anneals}_{fixing_threshold}_{elite_threshold}.csv
+# (thresholds rounded to one digit) in the same format as test_spvar.test_different_num_anneals does.
+# Rows of an existing file that the queue has no result for are kept, so a partial export
+# does not lose results of earlier exports or of test_spvar runs.
+# Files are replaced atomically, so export may run while workers are still running.
+# If draw_bars = True, draws plot for every updated results directory
+# where all .csv files have at least 2 rows (draw_plot needs 2 points to compute bar width)
+def export_results(db_path : str, draw_bars : bool = False):
+    import pandas as pd
+
+    connection = connect(db_path)
+    try:
+        rows = connection.execute(
+            "SELECT dir_results, total_num_anneals, fixing_threshold, elite_threshold, "
+            "SPVAR_num_anneals, without_SPVAR, with_SPVAR, p_fixed FROM tasks WHERE status = ? "
+            "ORDER BY dir_results, total_num_anneals, fixing_threshold, elite_threshold, SPVAR_num_anneals",
+            (STATUS_DONE,)).fetchall()
+    finally:
+        connection.close()
+
+    # results[(dir_results, file name)] - list with elements in format
+    # [SPVAR_num_anneals, Result without SPVAR, Result with SPVAR, % fixed vars]
+    results = dict()
+    for (dir_results, total_num_anneals, fixing_threshold, elite_threshold, *result) in rows:
+        file_name = f"{total_num_anneals}_{round(fixing_threshold, 1)}_{round(elite_threshold, 1)}.csv"
+        results.setdefault(tuple([dir_results, file_name]), []).append(result)
+
+    columns = ["SPVAR num anneals", "Result without SPVAR", "Result with SPVAR", "% fixed vars"]
+
+    updated_dirs = set()
+
+    for (dir_results, file_name), data in results.items():
+        result_path = os.path.join(dir_results, file_name)
+        df = pd.DataFrame(data, columns=columns)
+        if df["SPVAR num anneals"].duplicated().any():
+            # distinct thresholds, e.g. 0.1 and 0.15, round to the same file name
+            print(f"Skip {result_path}: results of different thresholds would be merged")
+            continue
+
+        if os.path.isfile(result_path):
+            old_df = pd.read_csv(result_path, header=0, index_col=0)
+            old_df = old_df[~old_df["SPVAR num anneals"].isin(df["SPVAR num anneals"])]
+            df = pd.concat([old_df[columns], df])
+        df = df.sort_values("SPVAR num anneals").reset_index(drop=True)
+
+        os.makedirs(dir_results, exist_ok=True)
+        tmp_path = f"{result_path}.{default_worker_id().replace(':', '_')}.tmp"
+        df.to_csv(tmp_path)
+        os.replace(tmp_path, result_path)
+        updated_dirs.add(dir_results)
+
+    if draw_bars:
+        import test_spvar
+        for dir_results in sorted(updated_dirs):
+            # draw_plot draws every .csv in the directory, not only the exported ones
+            short_files = [
+                file for file in sorted(os.listdir(dir_results))
+                if os.path.splitext(file)[1] == ".csv"
+                and len(pd.read_csv(os.path.join(dir_results, file), header=0, index_col=0)) < 2
+            ]
+            if short_files:
+                print(f"Skip plot for {dir_results}: less than 2 results in {', '.join(short_files)}")
+                continue
+            test_spvar.draw_plot(dir_results)